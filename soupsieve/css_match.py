@@ -1,15 +1,16 @@
 """CSS matcher."""
 from __future__ import annotations
 from datetime import datetime
+from functools import lru_cache, partial
 from . import util
 import re
 from . import css_types as ct
 import unicodedata
 import bs4  # type: ignore[import]
-from typing import Iterator, Iterable, Any, Callable, Sequence, cast  # noqa: F401
+from typing import Iterator, Iterable, Any, Callable, Pattern, Sequence, cast  # noqa: F401
 
-# Empty tag pattern (whitespace okay)
-RE_NOT_EMPTY = re.compile('[^ \t\r\n\f]')
+# CSS whitespace
+WHITESPACE = ' \t\r\n\f'
 
 RE_NOT_WS = re.compile('[^ \t\r\n\f]+')
 
@@ -28,6 +29,9 @@ REL_HAS_CLOSE_SIBLING = ':+'
 NS_XHTML = 'http://www.w3.org/1999/xhtml'
 NS_XML = 'http://www.w3.org/XML/1998/namespace'
 
+# Namespaces used by internal selector lists that use the HTML flag
+HTML_NAMESPACES = ct.Namespaces({'html': NS_XHTML})
+
 DIR_FLAGS = ct.SEL_DIR_LTR | ct.SEL_DIR_RTL
 RANGES = ct.SEL_IN_RANGE | ct.SEL_OUT_OF_RANGE
 
@@ -47,6 +51,24 @@ RE_DATETIME = re.compile(
 )
 RE_WILD_STRIP = re.compile(r'(?:(?:-\*-)(?:\*(?:-|$))*|-\*$)')
 
+# Attribute value patterns (as built by the parser) that compare against a literal, escaped value
+PAT_ATTR_LITERAL = r'(?:\\.|[^\\.^$*+?{}\[\]|()])*'
+RE_ATTR_OPERATIONS = tuple(
+    (op, re.compile(re.escape(start) + f'({PAT_ATTR_LITERAL})' + re.escape(end), re.DOTALL))
+    for op, start, end in (
+        ('=', '^', '$'),
+        ('^=', '^', '.*'),
+        ('$=', '.*?', '$'),
+        ('*=', '.*?', '.*'),
+        ('~=', r'.*?(?:(?<=^)|(?<=[ \t\r\n\f]))', r'(?=(?:[ \t\r\n\f]|$)).*'),
+        ('|=', '^', '(?:-.*)?$')
+    )
+)
+RE_ATTR_UNESCAPE = re.compile(r'\\(.)', re.DOTALL)
+
+# Translate CSS whitespace to spaces
+WS_TRANSLATION = str.maketrans('\t\r\n\f', '    ')
+
 MONTHS_30 = (4, 6, 9, 11)  # April, June, September, and November
 FEB = 2
 SHORT_MONTH = 30
@@ -56,6 +78,71 @@ FEB_LEAP_MONTH = 29
 DAYS_IN_WEEK = 7
 
 
+@lru_cache(maxsize=512)
+def get_attribute_operation(pattern: Pattern[str]) -> tuple[str, str] | None:
+    """
+    Get the operation and literal value of an attribute pattern.
+
+    Returns `None` if the pattern does something other than a case sensitive comparison against a literal.
+    Patterns without `re.DOTALL` (such as the case sensitive XML `type` pattern) stop `.` at newlines,
+    which the string operations do not mimic, so they are also left to the regular expression.
+    """
+
+    if pattern.flags & re.I or not pattern.flags & re.DOTALL:
+        return None
+    for op, regex in RE_ATTR_OPERATIONS:
+        m = regex.fullmatch(pattern.pattern)
+        if m:
+            return op, RE_ATTR_UNESCAPE.sub(r'\1', m.group(1))
+    return None
+
+
+def match_attribute_operation(value: str | Sequence[str], op: str, expected: str) -> bool:
+    """
+    Compare an attribute value without a regular expression.
+
+    Comparisons mirror the patterns created by the parser, including `$` matching before a trailing newline.
+    """
+
+    if not isinstance(value, str):
+        if op == '~=':
+            # A word never spans the items of a multi-valued attribute (like `class`), so search each item
+            # instead of joining them. Items are usually single words, but assigned ones may hold several.
+            for item in value:
+                if expected in item and expected in item.translate(WS_TRANSLATION).split(' '):
+                    return True
+            return False
+        value = ' '.join(value)
+
+    if op == '^=':
+        return value.startswith(expected)
+    elif op == '*=':
+        return expected in value
+    elif op == '~=':
+        return expected in value.translate(WS_TRANSLATION).split(' ')
+    elif op == '$=':
+        return value.endswith(expected) or (value.endswith('\n') and value[:-1].endswith(expected))
+    # Handle `=` and `|=`
+    if not value.startswith(expected):
+        return False
+    rest = value[len(expected):]
+    return rest in ('', '\n') or (op == '|=' and rest.startswith('-'))
+
+
+def match_nth_index(index: int, a: int, var: bool, b: int) -> bool:
+    """
+    Check whether an `nth` index satisfies `an + b`.
+
+    Without a variable, the index must be exactly `a`, otherwise it must equal `an + b` for some `n >= 0`.
+    """
+
+    if not var:
+        return index == a
+    if a == 0:
+        return index == b
+    return (index - b) % a == 0 and (index - b) // a >= 0
+
+
 class _FakeParent:
     """
     Fake parent class.
@@ -178,7 +265,9 @@ class _DocumentNav:
         """Get children."""
 
         if not no_iframe or not self.is_iframe(el):
-            last = len(el.contents) - 1
+            contents = el.contents
+            is_tag = self.is_tag
+            last = len(contents) - 1
             if start is None:
                 index = last if reverse else 0
             else:
@@ -188,9 +277,9 @@ class _DocumentNav:
 
             if 0 <= index <= last:
                 while index != end:
-                    node = el.contents[index]
+                    node = contents[index]
                     index += incr
-                    if not tags or self.is_tag(node):
+                    if not tags or is_tag(node):
                         yield node
 
     def get_descendants(
@@ -201,7 +290,14 @@ class _DocumentNav:
     ) -> Iterator[bs4.PageElement]:
         """Get descendants."""
 
-        if not no_iframe or not self.is_iframe(el):
+        if not no_iframe:
+            # Nothing to skip, so avoid the `iframe` bookkeeping in this (most common) case.
+            is_tag_node = self.is_tag
+            for child in el.descendants:
+                if not tags or is_tag_node(child):
+                    yield child
+
+        elif not self.is_iframe(el):
             next_good = None
             for child in el.descendants:
 
@@ -212,7 +308,7 @@ class _DocumentNav:
 
                 is_tag = self.is_tag(child)
 
-                if no_iframe and is_tag and self.is_iframe(child):
+                if is_tag and self.is_iframe(child):
                     if child.next_sibling is not None:
                         next_good = child.next_sibling
                     else:
@@ -353,15 +449,6 @@ class _DocumentNav:
         for k, v in el.attrs.items():
             yield k, cls.normalize_value(v)
 
-    @classmethod
-    def get_classes(cls, el: bs4.Tag) -> Sequence[str]:
-        """Get classes."""
-
-        classes = cls.get_attribute_by_name(el, 'class', [])
-        if isinstance(classes, str):
-            classes = RE_NOT_WS.findall(classes)
-        return cast(Sequence[str], classes)
-
     def get_text(self, el: bs4.Tag, no_iframe: bool = False) -> str:
         """Get text."""
 
@@ -495,8 +582,16 @@ class CSSMatch(_DocumentNav):
         self.cached_meta_lang = []  # type: list[tuple[str, str]]
         self.cached_default_forms = []  # type: list[tuple[bs4.Tag, bs4.Tag]]
         self.cached_indeterminate_forms = []  # type: list[tuple[bs4.Tag, str, bool]]
+        self.cached_compiled = {}  # type: dict[int, tuple[tuple[Callable[[CSSMatch, bs4.Tag], bool], ...], ...]]
+        self.cached_matches = {}  # type: dict[tuple[int, int, bool], bool]
+        self.cached_tag_names = {}  # type: dict[int, str]
+        self.cached_attributes = {}  # type: dict[int, dict[str, str | Sequence[str] | None]]
+        self.cached_ns_attributes = {}  # type: dict[int, dict[tuple[str, str], str | Sequence[str] | None]]
+        self.cached_children = {}  # type: dict[int, list[bs4.Tag]]
+        self.cached_nth_indexes = {}  # type: dict[tuple[Any, ...], dict[int, int]]
         self.selectors = selectors
         self.namespaces = {} if namespaces is None else namespaces  # type: ct.Namespaces | dict[str, str]
+        self.default_namespace = self.namespaces.get('')
         self.flags = flags
         self.iframe_restrict = False
 
@@ -521,16 +616,13 @@ class CSSMatch(_DocumentNav):
         # A document can be both XML and HTML (XHTML)
         self.is_xml = self.is_xml_tree(doc)
         self.is_html = not self.is_xml or self.has_html_namespace
-
-    def supports_namespaces(self) -> bool:
-        """Check if namespaces are supported in the HTML type."""
-
-        return self.is_xml or self.has_html_namespace
+        # Namespaces are supported in XML and HTML that has a namespace
+        self.supports_namespaces = self.is_xml or self.has_html_namespace
 
     def get_tag_ns(self, el: bs4.Tag) -> str:
         """Get tag namespace."""
 
-        if self.supports_namespaces():
+        if self.supports_namespaces:
             namespace = ''
             ns = self.get_uri(el)
             if ns:
@@ -547,8 +639,14 @@ class CSSMatch(_DocumentNav):
     def get_tag(self, el: bs4.Tag) -> str | None:
         """Get tag."""
 
-        name = self.get_tag_name(el)
-        return util.lower(name) if name is not None and not self.is_xml else name
+        name = self.cached_tag_names.get(id(el))
+        if name is None:
+            name = self.get_tag_name(el)
+            if name is not None:
+                if not self.is_xml:
+                    name = util.lower(name)
+                self.cached_tag_names[id(el)] = name
+        return name
 
     def get_prefix(self, el: bs4.Tag) -> str | None:
         """Get prefix."""
@@ -648,6 +746,39 @@ class CSSMatch(_DocumentNav):
 
         return match
 
+    def get_normalized_attributes(self, el: bs4.Tag) -> dict[str, str | Sequence[str] | None]:
+        """
+        Get the element's attributes keyed by name (lowercase name if not XML).
+
+        If multiple attributes normalize to the same name, the first one wins.
+        """
+
+        attributes = self.cached_attributes.get(id(el))
+        if attributes is None:
+            attributes = {}
+            for k, v in self.iter_attributes(el):
+                attributes.setdefault(k if self.is_xml else util.lower(k), v)
+            self.cached_attributes[id(el)] = attributes
+        return attributes
+
+    def get_namespaced_attributes(self, el: bs4.Tag) -> dict[tuple[str, str], str | Sequence[str] | None]:
+        """
+        Get the element's namespaced attributes keyed by namespace and name (lowercase name if not XML).
+
+        If multiple attributes normalize to the same namespace and name, the first one wins.
+        """
+
+        attributes = self.cached_ns_attributes.get(id(el))
+        if attributes is None:
+            attributes = {}
+            for k, v in self.iter_attributes(el):
+                namespace, name = self.split_namespace(el, k)
+                if namespace is None or name is None:
+                    continue
+                attributes.setdefault((namespace, name if self.is_xml else util.lower(name)), v)
+            self.cached_ns_attributes[id(el)] = attributes
+        return attributes
+
     def match_attribute_name(
         self,
         el: bs4.Tag,
@@ -656,9 +787,8 @@ class CSSMatch(_DocumentNav):
     ) -> str | Sequence[str] | None:
         """Match attribute name and return value if it exists."""
 
-        value = None
-        if self.supports_namespaces():
-            value = None
+        name = attr if self.is_xml else util.lower(attr)
+        if self.supports_namespaces:
             # If we have not defined namespaces, we can't very well find them, so don't bother trying.
             if prefix:
                 ns = self.namespaces.get(prefix)
@@ -667,128 +797,123 @@ class CSSMatch(_DocumentNav):
             else:
                 ns = None
 
-            for k, v in self.iter_attributes(el):
+            # Can't match a prefix attribute as we haven't specified one to match
+            # Try to match it normally as a whole `p:a` as selector may be trying `p\:a`.
+            if ns is None:
+                return self.get_normalized_attributes(el).get(name)
 
-                # Get attribute parts
-                namespace, name = self.split_namespace(el, k)
+            # Any namespace is acceptable, so take the first prefixed attribute with the desired name.
+            if prefix == '*':
+                for (_, n), v in self.get_namespaced_attributes(el).items():
+                    if n == name:
+                        return v
+                return None
 
-                # Can't match a prefix attribute as we haven't specified one to match
-                # Try to match it normally as a whole `p:a` as selector may be trying `p\:a`.
-                if ns is None:
-                    if (self.is_xml and attr == k) or (not self.is_xml and util.lower(attr) == util.lower(k)):
-                        value = v
-                        break
-                    # Coverage is not finding this even though it is executed.
-                    # Adding a print statement before this (and erasing coverage) causes coverage to find the line.
-                    # Ignore the false positive message.
-                    continue  # pragma: no cover
-
-                # We can't match our desired prefix attribute as the attribute doesn't have a prefix
-                if namespace is None or ns != namespace and prefix != '*':
-                    continue
-
-                # The attribute doesn't match.
-                if (util.lower(attr) != util.lower(name)) if not self.is_xml else (attr != name):
-                    continue
-
-                value = v
-                break
-        else:
-            for k, v in self.iter_attributes(el):
-                if util.lower(attr) != util.lower(k):
-                    continue
-                value = v
-                break
-        return value
+            return self.get_namespaced_attributes(el).get((ns, name))
+        return self.get_normalized_attributes(el).get(name)
 
     def match_namespace(self, el: bs4.Tag, tag: ct.SelectorTag) -> bool:
         """Match the namespace of the element."""
 
-        match = True
-        namespace = self.get_tag_ns(el)
-        default_namespace = self.namespaces.get('')
-        tag_ns = '' if tag.prefix is None else self.namespaces.get(tag.prefix)
+        prefix = tag.prefix
         # We must match the default namespace if one is not provided
-        if tag.prefix is None and (default_namespace is not None and namespace != default_namespace):
-            match = False
+        if prefix is None:
+            return self.default_namespace is None or self.get_tag_ns(el) == self.default_namespace
+        namespace = self.get_tag_ns(el)
         # If we specified `|tag`, we must not have a namespace.
-        elif (tag.prefix is not None and tag.prefix == '' and namespace):
-            match = False
+        if prefix == '':
+            return not namespace
         # Verify prefix matches
-        elif (
-            tag.prefix and
-            tag.prefix != '*' and (tag_ns is None or namespace != tag_ns)
-        ):
-            match = False
-        return match
+        tag_ns = self.namespaces.get(prefix)
+        return tag_ns is not None and namespace == tag_ns
 
-    def match_attributes(self, el: bs4.Tag, attributes: tuple[ct.SelectorAttribute, ...]) -> bool:
-        """Match attributes."""
+    def compile_attributes(
+        self,
+        attributes: tuple[ct.SelectorAttribute, ...]
+    ) -> tuple[tuple[str, str, Pattern[str] | None, tuple[str, str] | None], ...]:
+        """Resolve the pattern to use for each attribute and, if possible, the string operation that replaces it."""
+
+        compiled = []
+        for a in attributes:
+            pattern = a.xml_type_pattern if self.is_xml and a.xml_type_pattern else a.pattern
+            operation = get_attribute_operation(pattern) if pattern is not None else None
+            compiled.append((a.attribute, a.prefix, pattern, operation))
+        return tuple(compiled)
+
+    def match_attributes(
+        self,
+        el: bs4.Tag,
+        attributes: tuple[tuple[str, str, Pattern[str] | None, tuple[str, str] | None], ...]
+    ) -> bool:
+        """Match attributes (as compiled by `compile_attributes`)."""
 
         match = True
-        if attributes:
-            for a in attributes:
-                temp = self.match_attribute_name(el, a.attribute, a.prefix)
-                pattern = a.xml_type_pattern if self.is_xml and a.xml_type_pattern else a.pattern
-                if temp is None:
-                    match = False
-                    break
-                value = temp if isinstance(temp, str) else ' '.join(temp)
-                if pattern is None:
-                    continue
-                elif pattern.match(value) is None:
+        for attribute, prefix, pattern, operation in attributes:
+            temp = self.match_attribute_name(el, attribute, prefix)
+            if temp is None:
+                match = False
+                break
+            if pattern is None:
+                continue
+            if operation is not None:
+                if not match_attribute_operation(temp, *operation):
                     match = False
                     break
+            elif pattern.match(temp if isinstance(temp, str) else ' '.join(temp)) is None:
+                match = False
+                break
         return match
 
-    def match_tagname(self, el: bs4.Tag, tag: ct.SelectorTag) -> bool:
-        """Match tag name."""
+    def normalize_tag(self, tag: ct.SelectorTag) -> ct.SelectorTag:
+        """Normalize the selector's tag name to match the case of the names returned by `get_tag`."""
 
-        name = (util.lower(tag.name) if not self.is_xml and tag.name is not None else tag.name)
-        return not (
-            name is not None and
-            name not in (self.get_tag(el), '*')
-        )
+        if self.is_xml or tag.name is None:
+            return tag
+        name = util.lower(tag.name)
+        return tag if name == tag.name else ct.SelectorTag(name, tag.prefix)
 
-    def match_tag(self, el: bs4.Tag, tag: ct.SelectorTag | None) -> bool:
-        """Match the tag."""
+    def match_tagname(self, el: bs4.Tag, name: str) -> bool:
+        """Match tag name (the name is expected to be normalized with `normalize_tag`)."""
 
-        match = True
-        if tag is not None:
-            # Verify namespace
-            if not self.match_namespace(el, tag):
-                match = False
-            if not self.match_tagname(el, tag):
-                match = False
-        return match
+        return self.get_tag(el) == name
+
+    def match_past_parent(self, el: bs4.Tag, relation: ct.SelectorList) -> bool:
+        """Match an ancestor (descendant combinator)."""
+
+        # Ancestors are walked often and deep, so keep the loop lean.
+        match = self.match_selectors
+        get_parent = self.get_parent
+        no_iframe = self.iframe_restrict
+        parent = get_parent(el, no_iframe=no_iframe)
+        while parent:
+            if match(parent, relation):
+                return True
+            parent = get_parent(parent, no_iframe=no_iframe)
+        return False
+
+    def match_past_close_parent(self, el: bs4.Tag, relation: ct.SelectorList) -> bool:
+        """Match the parent (child combinator)."""
+
+        parent = self.get_parent(el, no_iframe=self.iframe_restrict)
+        return bool(parent) and self.match_selectors(parent, relation)
+
+    def match_past_sibling(self, el: bs4.Tag, relation: ct.SelectorList) -> bool:
+        """Match a preceding sibling (subsequent-sibling combinator)."""
+
+        match = self.match_selectors
+        is_tag = self.is_tag
+        sibling = el.previous_sibling
+        while sibling is not None:
+            if is_tag(sibling) and match(cast(bs4.Tag, sibling), relation):
+                return True
+            sibling = sibling.previous_sibling
+        return False
+
+    def match_past_close_sibling(self, el: bs4.Tag, relation: ct.SelectorList) -> bool:
+        """Match the immediately preceding sibling (next-sibling combinator)."""
 
-    def match_past_relations(self, el: bs4.Tag, relation: ct.SelectorList) -> bool:
-        """Match past relationship."""
-
-        found = False
-        # I don't think this can ever happen, but it makes `mypy` happy
-        if isinstance(relation[0], ct.SelectorNull):  # pragma: no cover
-            return found
-
-        if relation[0].rel_type == REL_PARENT:
-            parent = self.get_parent(el, no_iframe=self.iframe_restrict)
-            while not found and parent:
-                found = self.match_selectors(parent, relation)
-                parent = self.get_parent(parent, no_iframe=self.iframe_restrict)
-        elif relation[0].rel_type == REL_CLOSE_PARENT:
-            parent = self.get_parent(el, no_iframe=self.iframe_restrict)
-            if parent:
-                found = self.match_selectors(parent, relation)
-        elif relation[0].rel_type == REL_SIBLING:
-            sibling = self.get_previous(el)
-            while not found and sibling:
-                found = self.match_selectors(sibling, relation)
-                sibling = self.get_previous(sibling)
-        elif relation[0].rel_type == REL_CLOSE_SIBLING:
-            sibling = self.get_previous(el)
-            if sibling and self.is_tag(sibling):
-                found = self.match_selectors(sibling, relation)
-        return found
+        sibling = self.get_previous(el)
+        return bool(sibling) and self.is_tag(sibling) and self.match_selectors(sibling, relation)
 
     def match_future_child(self, parent: bs4.Tag, relation: ct.SelectorList, recursive: bool = False) -> bool:
         """Match future child."""
@@ -798,70 +923,83 @@ class CSSMatch(_DocumentNav):
             children = self.get_descendants  # type: Callable[..., Iterator[bs4.Tag]]
         else:
             children = self.get_children
+        match_selectors = self.match_selectors
         for child in children(parent, no_iframe=self.iframe_restrict):
-            match = self.match_selectors(child, relation)
+            match = match_selectors(child, relation)
             if match:
                 break
         return match
 
-    def match_future_relations(self, el: bs4.Tag, relation: ct.SelectorList) -> bool:
-        """Match future relationship."""
-
-        found = False
-        # I don't think this can ever happen, but it makes `mypy` happy
-        if isinstance(relation[0], ct.SelectorNull):  # pragma: no cover
-            return found
-
-        if relation[0].rel_type == REL_HAS_PARENT:
-            found = self.match_future_child(el, relation, True)
-        elif relation[0].rel_type == REL_HAS_CLOSE_PARENT:
-            found = self.match_future_child(el, relation)
-        elif relation[0].rel_type == REL_HAS_SIBLING:
-            sibling = self.get_next(el)
-            while not found and sibling:
-                found = self.match_selectors(sibling, relation)
-                sibling = self.get_next(sibling)
-        elif relation[0].rel_type == REL_HAS_CLOSE_SIBLING:
-            sibling = self.get_next(el)
-            if sibling and self.is_tag(sibling):
-                found = self.match_selectors(sibling, relation)
-        return found
+    def match_future_parent(self, el: bs4.Tag, relation: ct.SelectorList) -> bool:
+        """Match a descendant (`:has()` with a descendant combinator)."""
 
-    def match_relations(self, el: bs4.Tag, relation: ct.SelectorList) -> bool:
-        """Match relationship to other elements."""
+        return self.match_future_child(el, relation, True)
 
-        found = False
+    def match_future_close_parent(self, el: bs4.Tag, relation: ct.SelectorList) -> bool:
+        """Match a child (`:has()` with a child combinator)."""
 
-        if isinstance(relation[0], ct.SelectorNull) or relation[0].rel_type is None:
-            return found
+        return self.match_future_child(el, relation)
 
-        if relation[0].rel_type.startswith(':'):
-            found = self.match_future_relations(el, relation)
-        else:
-            found = self.match_past_relations(el, relation)
+    def match_future_sibling(self, el: bs4.Tag, relation: ct.SelectorList) -> bool:
+        """Match a following sibling (`:has()` with a subsequent-sibling combinator)."""
+
+        match = self.match_selectors
+        is_tag = self.is_tag
+        sibling = el.next_sibling
+        while sibling is not None:
+            if is_tag(sibling) and match(cast(bs4.Tag, sibling), relation):
+                return True
+            sibling = sibling.next_sibling
+        return False
+
+    def match_future_close_sibling(self, el: bs4.Tag, relation: ct.SelectorList) -> bool:
+        """Match the immediately following sibling (`:has()` with a next-sibling combinator)."""
+
+        sibling = self.get_next(el)
+        return bool(sibling) and self.is_tag(sibling) and self.match_selectors(sibling, relation)
+
+    # Relationship matchers by combinator (`:` prefixed combinators are relative selectors used by `:has()`).
+    # These are plain functions, called with the matcher, so the table is shared by all matchers.
+    relation_matchers = {
+        REL_PARENT: match_past_parent,
+        REL_CLOSE_PARENT: match_past_close_parent,
+        REL_SIBLING: match_past_sibling,
+        REL_CLOSE_SIBLING: match_past_close_sibling,
+        REL_HAS_PARENT: match_future_parent,
+        REL_HAS_CLOSE_PARENT: match_future_close_parent,
+        REL_HAS_SIBLING: match_future_sibling,
+        REL_HAS_CLOSE_SIBLING: match_future_close_sibling
+    }  # type: dict[str, Callable[[CSSMatch, bs4.Tag, ct.SelectorList], bool]]
+
+    def match_relations(self, el: bs4.Tag, relation: ct.SelectorList) -> bool:
+        """Match relationship to other elements."""
 
-        return found
+        # I don't think the null case can ever happen, but it makes `mypy` happy
+        if isinstance(relation[0], ct.SelectorNull) or relation[0].rel_type is None:
+            return False
+        return self.relation_matchers[relation[0].rel_type](self, el, relation)
 
     def match_id(self, el: bs4.Tag, ids: tuple[str, ...]) -> bool:
-        """Match element's ID."""
+        """Match element's ID (the selector's IDs are expected to be unique, so there is usually only one)."""
 
-        found = True
+        el_id = self.get_attribute_by_name(el, 'id', '')
         for i in ids:
-            if i != self.get_attribute_by_name(el, 'id', ''):
-                found = False
-                break
-        return found
+            if i != el_id:
+                return False
+        return True
+
+    def get_class_set(self, el: bs4.Tag) -> frozenset[str]:
+        """Get the element's classes as a set."""
 
-    def match_classes(self, el: bs4.Tag, classes: tuple[str, ...]) -> bool:
+        value = self.get_normalized_attributes(el).get('class')
+        if value is None:
+            return frozenset()
+        return frozenset(RE_NOT_WS.findall(value) if isinstance(value, str) else value)
+
+    def match_classes(self, el: bs4.Tag, classes: frozenset[str]) -> bool:
         """Match element's classes."""
 
-        current_classes = self.get_classes(el)
-        found = True
-        for c in classes:
-            if c not in current_classes:
-                found = False
-                break
-        return found
+        return classes <= self.get_class_set(el)
 
     def match_root(self, el: bs4.Tag) -> bool:
         """Match element as root."""
@@ -902,116 +1040,88 @@ class CSSMatch(_DocumentNav):
             (self.get_tag_ns(child) == self.get_tag_ns(el))
         )
 
-    def match_nth(self, el: bs4.Tag, nth: bs4.Tag) -> bool:
-        """Match `nth` elements."""
+    def get_tag_children(self, parent: bs4.Tag) -> list[bs4.Tag]:
+        """
+        Get the tag children of a parent.
+
+        Only tags count towards `nth` indexes, so the children are filtered once per parent
+        and shared by all the `nth` selectors evaluated against that parent.
+        """
+
+        # A fake parent only lives for the current evaluation, so it can't be cached.
+        if isinstance(parent, _FakeParent):
+            return list(self.get_children(parent))
 
-        matched = True
+        children = self.cached_children.get(id(parent))
+        if children is None:
+            children = self.cached_children[id(parent)] = list(self.get_children(parent))
+        return children
+
+    def get_nth_indexes(self, el: bs4.Tag, parent: bs4.Tag, n: ct.SelectorNth) -> dict[int, int]:
+        """
+        Get the `nth` index (starting at 1) of every child of the parent relevant to the `nth` selector.
+
+        Only tag children that match the `of S` selectors (and share the element's type for `of-type`)
+        are indexed. Indexes are cached per parent, so evaluating all of a parent's children against
+        the same `nth` selector only walks the children once.
+        """
+
+        key = (
+            id(parent),
+            id(n.selectors),
+            (self.get_tag(el), self.get_tag_ns(el)) if n.of_type else None,
+            self.iframe_restrict
+        )
+        indexes = self.cached_nth_indexes.get(key)
+        if indexes is None:
+            indexes = {}
+            index = 0
+            selectors = n.selectors
+            of_type = n.of_type
+            match_selectors = self.match_selectors
+            match_nth_tag_type = self.match_nth_tag_type
+            for child in self.get_tag_children(parent):
+                # Handle `of S` in `nth-child`
+                if selectors and not match_selectors(child, selectors):
+                    continue
+                # Handle `of-type`
+                if of_type and not match_nth_tag_type(el, child):
+                    continue
+                index += 1
+                indexes[id(child)] = index
+            # A fake parent only lives for the current evaluation, so it can't be cached.
+            if not isinstance(parent, _FakeParent):
+                self.cached_nth_indexes[key] = indexes
+        return indexes
+
+    def match_nth(self, el: bs4.Tag, nth: tuple[ct.SelectorNth, ...]) -> bool:
+        """Match `nth` elements."""
 
         for n in nth:
-            matched = False
             if n.selectors and not self.match_selectors(el, n.selectors):
-                break
+                return False
             parent = self.get_parent(el)
             if parent is None:
                 parent = self.create_fake_parent(el)
-            last = n.last
-            last_index = len(parent) - 1
-            index = last_index if last else 0
-            relative_index = 0
-            a = n.a
-            b = n.b
-            var = n.n
-            count = 0
-            count_incr = 1
-            factor = -1 if last else 1
-            idx = last_idx = a * count + b if var else a
-
-            # We can only adjust bounds within a variable index
-            if var:
-                # Abort if our nth index is out of bounds and only getting further out of bounds as we increment.
-                # Otherwise, increment to try to get in bounds.
-                adjust = None
-                while idx < 1 or idx > last_index:
-                    if idx < 0:
-                        diff_low = 0 - idx
-                        if adjust is not None and adjust == 1:
-                            break
-                        adjust = -1
-                        count += count_incr
-                        idx = last_idx = a * count + b if var else a
-                        diff = 0 - idx
-                        if diff >= diff_low:
-                            break
-                    else:
-                        diff_high = idx - last_index
-                        if adjust is not None and adjust == -1:
-                            break
-                        adjust = 1
-                        count += count_incr
-                        idx = last_idx = a * count + b if var else a
-                        diff = idx - last_index
-                        if diff >= diff_high:
-                            break
-                        diff_high = diff
-
-                # If a < 0, our count is working backwards, so floor the index by increasing the count.
-                # Find the count that yields the lowest, in bound value and use that.
-                # Lastly reverse count increment so that we'll increase our index.
-                lowest = count
-                if a < 0:
-                    while idx >= 1:
-                        lowest = count
-                        count += count_incr
-                        idx = last_idx = a * count + b if var else a
-                    count_incr = -1
-                count = lowest
-                idx = last_idx = a * count + b if var else a
-
-            # Evaluate elements while our calculated nth index is still in range
-            while 1 <= idx <= last_index + 1:
-                child = None
-                # Evaluate while our child index is still in range.
-                for child in self.get_children(parent, start=index, reverse=factor < 0, tags=False):
-                    index += factor
-                    if not self.is_tag(child):
-                        continue
-                    # Handle `of S` in `nth-child`
-                    if n.selectors and not self.match_selectors(child, n.selectors):
-                        continue
-                    # Handle `of-type`
-                    if n.of_type and not self.match_nth_tag_type(el, child):
-                        continue
-                    relative_index += 1
-                    if relative_index == idx:
-                        if child is el:
-                            matched = True
-                        else:
-                            break
-                    if child is el:
-                        break
-                if child is el:
-                    break
-                last_idx = idx
-                count += count_incr
-                if count < 0:
-                    # Count is counting down and has now ventured into invalid territory.
-                    break
-                idx = a * count + b if var else a
-                if last_idx == idx:
-                    break
-            if not matched:
-                break
-        return matched
+            indexes = self.get_nth_indexes(el, parent, n)
+            index = indexes[id(el)]
+            if n.last:
+                index = len(indexes) - index + 1
+
+            if not match_nth_index(index, n.a, n.n, n.b):
+                return False
+        return True
 
     def match_empty(self, el: bs4.Tag) -> bool:
         """Check if element is empty (if requested)."""
 
         is_empty = True
-        for child in self.get_children(el, tags=False):
+        for child in self.get_contents(el):
             if self.is_tag(child):
                 is_empty = False
                 break
-            elif self.is_content_string(child) and RE_NOT_EMPTY.search(child):
+            # Whitespace is okay
+            elif self.is_content_string(child) and child.strip(WHITESPACE):
                 is_empty = False
                 break
         return is_empty
@@ -1157,7 +1267,7 @@ class CSSMatch(_DocumentNav):
         """Match languages."""
 
         match = False
-        has_ns = self.supports_namespaces()
+        has_ns = self.supports_namespaces
         root = self.root
         has_html_namespace = self.has_html_namespace
 
@@ -1376,9 +1486,117 @@ class CSSMatch(_DocumentNav):
 
         return match
 
+    def compile_selector(self, selector: ct.Selector) -> tuple[Callable[[CSSMatch, bs4.Tag], bool], ...]:
+        """
+        Compile a selector into the checks it requires.
+
+        Only the features present in the selector get a check, and each check has its
+        arguments bound up front, so evaluating an element doesn't have to test for
+        (and skip) all the features a selector doesn't use.
+
+        Checks are plain functions called with the matcher and the element. Bound methods
+        cached on the matcher would reference the matcher itself, keeping it (and all of
+        its caches) alive until the garbage collector runs.
+        """
+
+        checks = []  # type: list[Callable[[CSSMatch, bs4.Tag], bool]]
+        flags = selector.flags
+        tag = selector.tag
+
+        # A universal tag (`*` or `*|*`) matches everything unless a default namespace must be enforced.
+        if tag is not None and tag.name == '*' and (
+            tag.prefix == '*' or (tag.prefix is None and self.default_namespace is None)
+        ):
+            tag = None
+
+        # Cheap, highly discriminating checks go first and structural checks (`nth`, relations,
+        # `:has()`, etc.) go last so that most elements are rejected before the costly ones run.
+        # Verify tag matches. Whether the document is XML never changes, so the name's case is normalized
+        # once here. The namespace is resolved when matching, as `is_html` selector lists swap the namespaces.
+        if tag is not None:
+            tag = self.normalize_tag(tag)
+            if tag.name is not None and tag.name != '*':
+                checks.append(partial(CSSMatch.match_tagname, name=tag.name))
+            if tag.prefix != '*':
+                checks.append(partial(CSSMatch.match_namespace, tag=tag))
+        # Verify element is scope
+        if flags & ct.SEL_SCOPE:
+            checks.append(CSSMatch.match_scope)
+        # Verify id matches
+        if selector.ids:
+            checks.append(partial(CSSMatch.match_id, ids=tuple(set(selector.ids))))
+        # Verify classes match
+        if selector.classes:
+            checks.append(partial(CSSMatch.match_classes, classes=frozenset(selector.classes)))
+        # Verify attribute(s) match
+        if selector.attributes:
+            checks.append(partial(CSSMatch.match_attributes, attributes=self.compile_attributes(selector.attributes)))
+        # Verify tag is defined
+        if flags & ct.SEL_DEFINED:
+            checks.append(CSSMatch.match_defined)
+        # Verify element is root
+        if flags & ct.SEL_ROOT:
+            checks.append(CSSMatch.match_root)
+        if flags & ct.SEL_EMPTY:
+            checks.append(CSSMatch.match_empty)
+        # Verify element has placeholder shown
+        if flags & ct.SEL_PLACEHOLDER_SHOWN:
+            checks.append(CSSMatch.match_placeholder_shown)
+        # Verify ranges
+        if flags & RANGES:
+            checks.append(partial(CSSMatch.match_range, condition=flags & RANGES))
+        # Verify `nth` matches
+        if selector.nth:
+            checks.append(partial(CSSMatch.match_nth, nth=selector.nth))
+        # Verify language patterns
+        if selector.lang:
+            checks.append(partial(CSSMatch.match_lang, langs=selector.lang))
+        # Verify pseudo selector patterns
+        if selector.selectors:
+            checks.append(partial(CSSMatch.match_subselectors, selectors=selector.selectors))
+        # Verify relationship selectors
+        if selector.relation:
+            checks.append(partial(CSSMatch.match_relations, relation=selector.relation))
+        # Validate that the current default selector match corresponds to the first submit button in the form
+        if flags & ct.SEL_DEFAULT:
+            checks.append(CSSMatch.match_default)
+        # Validate that the unset radio button is among radio buttons with the same name in a form that are
+        # also not set.
+        if flags & ct.SEL_INDETERMINATE:
+            checks.append(CSSMatch.match_indeterminate)
+        # Validate element directionality
+        if flags & DIR_FLAGS:
+            checks.append(partial(CSSMatch.match_dir, directionality=flags & DIR_FLAGS))
+        # Validate that the tag contains the specified text.
+        if selector.contains:
+            checks.append(partial(CSSMatch.match_contains, contains=selector.contains))
+        return tuple(checks)
+
+    def compile_selectors(
+        self,
+        selectors: ct.SelectorList
+    ) -> tuple[tuple[Callable[[CSSMatch, bs4.Tag], bool], ...], ...]:
+        """Compile the selectors in a selector list, dropping any that can never match."""
+
+        # We have a un-matchable situation (like `:focus` as you can focus an element in this environment)
+        return tuple(
+            [self.compile_selector(selector) for selector in selectors if not isinstance(selector, ct.SelectorNull)]
+        )
+
     def match_selectors(self, el: bs4.Tag, selectors: ct.SelectorList) -> bool:
         """Check if element matches one of the selectors."""
 
+        # Relations cause ancestors and siblings to be evaluated against the same selectors over and over
+        # (once per descendant), so remember results for the life of this match. Internal HTML selector
+        # lists swap the namespaces and `iframe` restriction, so the restriction is part of the key.
+        # The top level selectors are only ever evaluated once per element, so there is nothing to gain there.
+        key = None
+        if selectors is not self.selectors:
+            key = (id(el), id(selectors), self.iframe_restrict)
+            cached = self.cached_matches.get(key)
+            if cached is not None:
+                return cached
+
         match = False
         is_not = selectors.is_not
         is_html = selectors.is_html
@@ -1386,86 +1604,67 @@ class CSSMatch(_DocumentNav):
         # Internal selector lists that use the HTML flag, will automatically get the `html` namespace.
         if is_html:
             namespaces = self.namespaces
+            default_namespace = self.default_namespace
             iframe_restrict = self.iframe_restrict
-            self.namespaces = {'html': NS_XHTML}
+            self.namespaces = HTML_NAMESPACES
+            self.default_namespace = None
             self.iframe_restrict = True
 
         if not is_html or self.is_html:
-            for selector in selectors:
-                match = is_not
-                # We have a un-matchable situation (like `:focus` as you can focus an element in this environment)
-                if isinstance(selector, ct.SelectorNull):
-                    continue
-                # Verify tag matches
-                if not self.match_tag(el, selector.tag):
-                    continue
-                # Verify tag is defined
-                if selector.flags & ct.SEL_DEFINED and not self.match_defined(el):
-                    continue
-                # Verify element is root
-                if selector.flags & ct.SEL_ROOT and not self.match_root(el):
-                    continue
-                # Verify element is scope
-                if selector.flags & ct.SEL_SCOPE and not self.match_scope(el):
-                    continue
-                # Verify element has placeholder shown
-                if selector.flags & ct.SEL_PLACEHOLDER_SHOWN and not self.match_placeholder_shown(el):
-                    continue
-                # Verify `nth` matches
-                if not self.match_nth(el, selector.nth):
-                    continue
-                if selector.flags & ct.SEL_EMPTY and not self.match_empty(el):
-                    continue
-                # Verify id matches
-                if selector.ids and not self.match_id(el, selector.ids):
-                    continue
-                # Verify classes match
-                if selector.classes and not self.match_classes(el, selector.classes):
-                    continue
-                # Verify attribute(s) match
-                if not self.match_attributes(el, selector.attributes):
-                    continue
-                # Verify ranges
-                if selector.flags & RANGES and not self.match_range(el, selector.flags & RANGES):
-                    continue
-                # Verify language patterns
-                if selector.lang and not self.match_lang(el, selector.lang):
-                    continue
-                # Verify pseudo selector patterns
-                if selector.selectors and not self.match_subselectors(el, selector.selectors):
-                    continue
-                # Verify relationship selectors
-                if selector.relation and not self.match_relations(el, selector.relation):
-                    continue
-                # Validate that the current default selector match corresponds to the first submit button in the form
-                if selector.flags & ct.SEL_DEFAULT and not self.match_default(el):
-                    continue
-                # Validate that the unset radio button is among radio buttons with the same name in a form that are
-                # also not set.
-                if selector.flags & ct.SEL_INDETERMINATE and not self.match_indeterminate(el):
-                    continue
-                # Validate element directionality
-                if selector.flags & DIR_FLAGS and not self.match_dir(el, selector.flags & DIR_FLAGS):
-                    continue
-                # Validate that the tag contains the specified text.
-                if selector.contains and not self.match_contains(el, selector.contains):
-                    continue
-                match = not is_not
-                break
+            compiled = self.cached_compiled.get(id(selectors))
+            if compiled is None:
+                compiled = self.cached_compiled[id(selectors)] = self.compile_selectors(selectors)
+            # If nothing matches, `:not()` lists match unless they are empty.
+            match = is_not and bool(selectors)
+            for checks in compiled:
+                for check in checks:
+                    if not check(self, el):
+                        break
+                else:
+                    match = not is_not
+                    break
 
         # Restore actual namespaces being used for external selector lists
         if is_html:
             self.namespaces = namespaces
+            self.default_namespace = default_namespace
             self.iframe_restrict = iframe_restrict
 
+        if key is not None:
+            self.cached_matches[key] = match
         return match
 
+    def get_candidate_tag_names(self) -> frozenset[str] | None:
+        """
+        Get the tag names an element must have to possibly match the top level selectors.
+
+        Returns `None` if any selector can match an element regardless of its name.
+        """
+
+        if self.selectors.is_not or self.selectors.is_html:
+            return None
+        names = set()
+        for selector in self.selectors:
+            if isinstance(selector, ct.SelectorNull):
+                continue
+            tag = selector.tag
+            if tag is None or tag.name is None or tag.name == '*':
+                return None
+            names.add(self.normalize_tag(tag).name)
+        return frozenset(names)
+
     def select(self, limit: int = 0) -> Iterator[bs4.Tag]:
         """Match all tags under the targeted tag."""
 
         lim = None if limit < 1 else limit
 
+        # When every selector requires a specific tag name, elements with other names are skipped
+        # without running the full matcher. Traversal is unchanged, so document order is preserved.
+        names = self.get_candidate_tag_names()
+        get_tag = self.get_tag
         for child in self.get_descendants(self.tag):
+            if names is not None and get_tag(child) not in names:
+                continue
             if self.match(child):
                 yield child
                 if lim is not None:
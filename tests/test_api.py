@@ -60,6 +60,25 @@ class TestSoupSieve(util.TestCase):
 
         self.assertEqual(['1', '2', '3', '4', '5', 'some-id', '6'], ids)
 
+    def test_select_tag_list_order(self):
+        """Test that a list of type selectors is returned in document order."""
+
+        markup = """
+        <html>
+        <body>
+        <p id="1"><code id="2"></code><img id="3" src="./image.png"/></p>
+        <pre id="4"></pre>
+        <p><span id="5" class="some-class"></span><span id="some-id"></span></p>
+        <pre id="6" class='ignore'></pre>
+        </body>
+        </html>
+        """
+
+        soup = self.soup(markup, 'html.parser')
+        ids = [el.attrs['id'] for el in sv.select('PRE, span, code', soup.body)]
+
+        self.assertEqual(['2', '4', '5', 'some-id', '6'], ids)
+
     def test_select_limit(self):
         """Test select limit."""
 
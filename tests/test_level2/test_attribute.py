@@ -255,6 +255,52 @@ class TestAttribute(util.TestCase):
             flags=util.XML
         )
 
+    def test_attribute_type_xml_newline(self):
+        """Test that the case sensitive XML `type` pattern does not let `.` match new lines."""
+
+        markup = """
+        <root>
+        <a type="x&#10;foo" id="0"></a>
+        <a type="foo-a&#10;b" id="1"></a>
+        <a type="foo" id="2"></a>
+        </root>
+        """
+
+        self.assert_selector(
+            markup,
+            '[type$="foo"]',
+            ['2'],
+            flags=util.XML
+        )
+
+        self.assert_selector(
+            markup,
+            '[type~="foo"]',
+            ['2'],
+            flags=util.XML
+        )
+
+        self.assert_selector(
+            markup,
+            '[type*="foo"]',
+            ['1', '2'],
+            flags=util.XML
+        )
+
+        self.assert_selector(
+            markup,
+            '[type|="foo"]',
+            ['2'],
+            flags=util.XML
+        )
+
+        self.assert_selector(
+            markup,
+            '[type^="x"]',
+            ['0'],
+            flags=util.XML
+        )
+
     def test_attribute_type_xhtml(self):
         """Type is treated as case insensitive in XHTML."""
 
@@ -287,6 +333,61 @@ class TestAttribute(util.TestCase):
             flags=util.XHTML
         )
 
+    def test_attribute_value_newlines(self):
+        """Test attribute value comparisons against values containing new lines."""
+
+        markup = """
+        <div id="div">
+        <p id="0" title="end&#10;"></p>
+        <p id="1" title="a&#10;end"></p>
+        <p id="2" title="start-a&#10;b"></p>
+        <p id="3" title="one&#10;two&#9;three"></p>
+        </div>
+        """
+
+        # Like the pattern `^end$`, a single trailing new line is allowed.
+        self.assert_selector(
+            markup,
+            '[title="end"]',
+            ['0'],
+            flags=util.HTML
+        )
+
+        self.assert_selector(
+            markup,
+            '[title$="end"]',
+            ['0', '1'],
+            flags=util.HTML
+        )
+
+        self.assert_selector(
+            markup,
+            '[title*="a\\a end"]',
+            ['1'],
+            flags=util.HTML
+        )
+
+        self.assert_selector(
+            markup,
+            '[title|="start"]',
+            ['2'],
+            flags=util.HTML
+        )
+
+        self.assert_selector(
+            markup,
+            '[title~="two"]',
+            ['3'],
+            flags=util.HTML
+        )
+
+        self.assert_selector(
+            markup,
+            '[title^="one"]',
+            ['3'],
+            flags=util.HTML
+        )
+
     def test_attribute_start_dash(self):
         """Test attribute whose dash separated value starts with the specified value."""
 
@@ -395,6 +496,19 @@ class TestAttribute(util.TestCase):
         soup.span['foo'] = [3, "4"]
         self.assertEqual(len(soup.select('span[foo="3 4"]')), 1)
 
+    def test_sequence_inputs_with_whitespace(self):
+        """Test assigned sequences whose items contain whitespace are compared as their serialized value."""
+
+        soup = BeautifulSoup('<span>text</span>', 'html.parser')
+        soup.span['class'] = ['a b', 'c']
+        soup.span['rel'] = ['x\ty']
+        self.assertEqual(len(soup.select('span[class~=a]')), 1)
+        self.assertEqual(len(soup.select('span[class~=c]')), 1)
+        self.assertEqual(len(soup.select('span[class="a b c"]')), 1)
+        self.assertEqual(len(soup.select('span[rel~=x]')), 1)
+        self.assertEqual(len(soup.select('span[rel~=y]')), 1)
+        self.assertEqual(len(soup.select('span[rel~="x\\9 y"]')), 0)
+
     def test_bytes_inputs(self):
         """Test weird inputs."""
 
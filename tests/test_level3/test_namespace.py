@@ -325,3 +325,14 @@ class TestNamespace(util.TestCase):
             namespaces={"xlink": "http://www.w3.org/1999/xlink"},
             flags=util.XHTML
         )
+
+    def test_attribute_namespace_any_prefix(self):
+        """Test that a `*` attribute prefix accepts any namespace when `*` is mapped as a prefix."""
+
+        self.assert_selector(
+            self.wrap_xlink(self.MARKUP_ATTR),
+            '[*|href*=forw],[*|other]',
+            ['2', '5'],
+            namespaces={"*": "x", "xlink": "http://www.w3.org/1999/xlink"},
+            flags=util.XML
+        )
@@ -213,6 +213,78 @@ class TestNthChild(util.TestCase):
             flags=util.HTML
         )
 
+    def test_nth_child_only_child(self):
+        """Test `nth` child when the element is the only child of its parent."""
+
+        markup = """
+        <body>
+        <div><p id="0"></p></div>
+        <div><p id="1"></p><p id="2"></p><p id="3"></p></div>
+        </body>
+        """
+
+        self.assert_selector(
+            markup,
+            "p:nth-child(2n+1)",
+            ['0', '1', '3'],
+            flags=util.HTML
+        )
+
+        self.assert_selector(
+            markup,
+            "p:nth-last-child(odd)",
+            ['0', '1', '3'],
+            flags=util.HTML
+        )
+
+        self.assert_selector(
+            markup,
+            "p:nth-child(3n+2)",
+            ['2'],
+            flags=util.HTML
+        )
+
+    def test_nth_child_zero_step(self):
+        """Test `nth` child with a zero step, which only matches the offset."""
+
+        markup = """
+        <body>
+        <p id="0"></p>
+        <p id="1"></p>
+        <span id="2"></span>
+        <span id="3"></span>
+        <span id="4"></span>
+        <span id="5"></span>
+        <span id="6"></span>
+        <p id="7"></p>
+        <p id="8"></p>
+        <p id="9"></p>
+        <p id="10"></p>
+        <span id="11"></span>
+        </body>
+        """
+
+        self.assert_selector(
+            markup,
+            "p:nth-child(0n+3)",
+            [],
+            flags=util.HTML
+        )
+
+        self.assert_selector(
+            markup,
+            "span:nth-child(0n+3)",
+            ['2'],
+            flags=util.HTML
+        )
+
+        self.assert_selector(
+            markup,
+            "p:nth-child(-0n+2)",
+            ['1'],
+            flags=util.HTML
+        )
+
     def test_nth_child_no_parent(self):
         """Test `nth` child with no parent."""
 